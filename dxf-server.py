@@ -5,12 +5,32 @@ dxf_server.py
 2. dxf_entities_to_csv    —— 提取实体+XDATA 并导出为 CSV
 """
 
-from pathlib import Path
+import asyncio
 import csv
+import io
+import os
+import sys
 import ezdxf
+from ezdxf import recover
+from ezdxf.entities import (
+    Arc,
+    Circle,
+    Insert,
+    Line,
+    LWPolyline,
+    MText,
+    Polyline,
+    Spline,
+    Text,
+)
 from ezdxf.layouts import Modelspace
 from tqdm import tqdm
 
+try:
+    from isal import igzip as gzip  # 可选依赖：ISA-L 实现的 gzip，压缩速度快数倍
+except ImportError:
+    import gzip
+
 from mcp.server.fastmcp import FastMCP  # FastMCP：最简单的 MCP 服务器实现
 
 # ----------------------------------------------------------------------
@@ -19,26 +39,25 @@ from mcp.server.fastmcp import FastMCP  # FastMCP：最简单的 MCP 服务器
 mcp = FastMCP("CAD-DXF 工具服务", dependencies=["ezdxf", "tqdm"])
 
 # ----------------------------------------------------------------------
-#  工具 1：检查 DXF 结构 & XDATA
+#  DXF 读取
 # ----------------------------------------------------------------------
-@mcp.tool(title="检查 DXF 结构并列出 XDATA")
-def inspect_dxf_structure(
-    filepath: str,
-    max_entities: int | None = 200,
-) -> list[str]:
-    """
-    分析并预览 DXF 文件中前若干个实体的类型、图层信息与 XDATA 数据。
+def _readfile(filepath: str):
+    """完整加载 DXF 文档；结构有误时退回 ezdxf.recover 尝试修复后加载。"""
+    try:
+        return ezdxf.readfile(filepath)
+    except ezdxf.DXFStructureError:
+        doc, _auditor = recover.readfile(filepath)
+        return doc
 
-    参数：
-    - filepath (str): DXF 文件的路径。
-    - max_entities (int | None): 最大显示实体数量，默认为 200。若为 None，则输出全部实体。
 
-    返回：
-    - list[str]: 每个实体的摘要信息（包含类型、图层及 XDATA 简述）。
-    """
+# ----------------------------------------------------------------------
+#  工具 1：检查 DXF 结构 & XDATA
+# ----------------------------------------------------------------------
+def _inspect_dxf(filepath: str, max_entities: int | None) -> list[str]:
+    """inspect_dxf_structure 的实际实现（在工作线程中运行）。"""
     messages: list[str] = []
     try:
-        doc = ezdxf.readfile(filepath)
+        doc = _readfile(filepath)
         msp: Modelspace = doc.modelspace()
     except (IOError, ezdxf.DXFStructureError) as e:
         return [f"加载 DXF 文件失败: {e}"]
@@ -53,120 +72,244 @@ def inspect_dxf_structure(
             break
 
         line = f"[{idx+1}] 类型:{ent.dxftype()} 图层:{ent.dxf.layer}"
-        if ent.has_xdata and ent.xdata is not None:
+        xd = ent.xdata
+        if xd:
             x_parts = []
-            for app in ent.xdata.data:
-                codes = [f"{c}:{v}" for c, v in ent.xdata.get(app)]
+            for app, tags in xd.data.items():
+                codes = [f"{c}:{v}" for c, v in tags]
                 x_parts.append(f"{app}({', '.join(codes)})")
             line += " | XDATA: " + "; ".join(x_parts)
         messages.append(line)
     return messages
 
 
-# ----------------------------------------------------------------------
-#  工具 2：DXF → CSV
-# ----------------------------------------------------------------------
-@mcp.tool(title="提取 DXF 实体并导出 CSV")
-def dxf_entities_to_csv(
+@mcp.tool(title="检查 DXF 结构并列出 XDATA")
+async def inspect_dxf_structure(
     filepath: str,
-    output_csv: str | None = None,
-) -> str:
+    max_entities: int | None = 200,
+) -> list[str]:
     """
-    将 DXF 文件中的所有实体及其属性（位置、图层、文本、XDATA 等）提取并保存为 CSV 表格。
+    分析并预览 DXF 文件中前若干个实体的类型、图层信息与 XDATA 数据。
 
     参数：
-    - filepath (str): 输入的 DXF 文件路径。
-    - output_csv (str | None): 可选，输出 CSV 文件路径。若未指定，将默认保存为与 DXF 同名的 CSV 文件。
+    - filepath (str): DXF 文件的路径。
+    - max_entities (int | None): 最大显示实体数量，默认为 200。若为 None，则输出全部实体。
 
     返回：
-    - str: 实际生成的 CSV 文件路径。
+    - list[str]: 每个实体的摘要信息（包含类型、图层及 XDATA 简述）。
     """
+    return await asyncio.to_thread(_inspect_dxf, filepath, max_entities)
+
+
+# ----------------------------------------------------------------------
+#  各实体类型的属性提取（按实体类 type(ent) 查表分派，避免逐个字符串比较）
+# ----------------------------------------------------------------------
+# CSV 固定列；XDATA 应用名作为动态列按字母序追加在其后
+PREFERRED_FIELDS = [
+    "Handle",
+    "EntityType",
+    "Layer",
+    "BlockName",
+    "TextValue",
+    "Radius",
+    "Position",
+]
+_PREFERRED_SET = frozenset(PREFERRED_FIELDS)
+_COL_BLOCK, _COL_TEXT, _COL_RADIUS, _COL_POS = 3, 4, 5, 6
+
+# CSV 输出文件的写缓冲大小，减少大文件顺序写入时的 write() 系统调用次数
+CSV_WRITE_BUFFER = 4 * 1024 * 1024
+
+# 预先绑定的坐标格式化函数，热循环中直接调用，省去 f-string 中的属性查找
+_PT = "({:.3f},{:.3f},{:.3f})".format
+_LINE = "Start({:.3f},{:.3f},{:.3f});End({:.3f},{:.3f},{:.3f})".format
+_CTR = "Center({:.3f},{:.3f},{:.3f})".format
+
+
+def _join_points(pts) -> str:
+    """将 (x, y, z) 点序列格式化为 "(x,y,z); (x,y,z); ..." 字符串。"""
+    return "; ".join([_PT(*p) for p in pts])
+
+
+def _fmt_polyline(ent, dxf, row: list) -> None:
+    row[_COL_POS] = _join_points(ent.points())
+
+
+def _fmt_lwpolyline(ent, dxf, row: list) -> None:
+    # LWPOLYLINE 只存 2D 顶点（OCS），z 取自 elevation
+    z = dxf.elevation
+    row[_COL_POS] = _join_points([(x, y, z) for x, y in ent.vertices()])
+
+
+def _fmt_line(ent, dxf, row: list) -> None:
+    row[_COL_POS] = _LINE(*dxf.start, *dxf.end)
+
+
+def _fmt_insert(ent, dxf, row: list) -> None:
+    row[_COL_POS] = _PT(*dxf.insert)
+    row[_COL_BLOCK] = dxf.name
+
+
+def _fmt_text(ent, dxf, row: list) -> None:
+    row[_COL_POS] = _PT(*dxf.insert)
+    row[_COL_TEXT] = dxf.text
+
+
+def _fmt_mtext(ent, dxf, row: list) -> None:
+    row[_COL_POS] = _PT(*dxf.insert)
+    row[_COL_TEXT] = ent.plain_text()
+
+
+def _fmt_circle(ent, dxf, row: list) -> None:
+    row[_COL_POS] = _CTR(*dxf.center)
+    row[_COL_RADIUS] = dxf.radius
+
+
+def _fmt_spline(ent, dxf, row: list) -> None:
+    row[_COL_POS] = _join_points(ent.control_points)
+
+
+# 具体实体类 → 提取函数；按 type(ent) 分派，ARC 与 CIRCLE 共用同一函数
+TYPE_HANDLERS = {
+    Polyline: _fmt_polyline,
+    LWPolyline: _fmt_lwpolyline,
+    Line: _fmt_line,
+    Insert: _fmt_insert,
+    Text: _fmt_text,
+    MText: _fmt_mtext,
+    Circle: _fmt_circle,
+    Arc: _fmt_circle,
+    Spline: _fmt_spline,
+}
+
+# dxftype → 提取函数，由 TYPE_HANDLERS 派生；用于未登记的子类（如 Polyface）
+HANDLERS = {cls.DXFTYPE: h for cls, h in TYPE_HANDLERS.items()}
+
+# 实际出现过的实体类 → 提取函数（含 None，表示无需格式化）
+_handler_cache: dict = {}
+
+
+def _entity_row(ent) -> list:
+    """按 PREFERRED_FIELDS 列序提取单个实体的固定列。"""
+    dxf = ent.dxf
+    etype = ent.dxftype()
+    row = [dxf.handle, etype, dxf.layer, "", "", "", "N/A"]
+    cls = type(ent)
     try:
-        # 路径处理
-        filepath = Path(filepath)
-        if not filepath.exists():
+        h = _handler_cache[cls]
+    except KeyError:
+        h = _handler_cache[cls] = TYPE_HANDLERS.get(cls) or HANDLERS.get(etype)
+    if h:
+        h(ent, dxf, row)
+    return row
+
+
+def _xdata_values(ent) -> dict[str, str]:
+    """提取实体各 XDATA 应用下的第一个 1000 组码字符串值。"""
+    x_values = {}
+    xd = ent.xdata  # 普通属性，取一次即可；无 XDATA 时为 None
+    if xd:
+        for app, tags in xd.data.items():
+            for code, value in tags:
+                if code == 1000:
+                    x_values[app] = value
+                    break
+    return x_values
+
+
+def _open_csv(path: str):
+    """打开 CSV 输出文件；扩展名为 .gz 时透明地写入 gzip 压缩流。"""
+    if path.endswith(".gz"):
+        # 压缩级别 1 吞吐最高；外层缓冲让压缩器按大块而非逐行工作
+        gz = gzip.GzipFile(path, "wb", compresslevel=1)
+        return io.TextIOWrapper(
+            io.BufferedWriter(gz, buffer_size=CSV_WRITE_BUFFER),
+            encoding="utf-8-sig",
+            newline="",
+        )
+    return open(
+        path, "w", newline="", encoding="utf-8-sig", buffering=CSV_WRITE_BUFFER
+    )
+
+
+# ----------------------------------------------------------------------
+#  工具 2：DXF → CSV
+# ----------------------------------------------------------------------
+def _export_csv(filepath: str, output_csv: str | None) -> str:
+    """dxf_entities_to_csv 的实际实现（在工作线程中运行）。"""
+    try:
+        # 路径处理：直接用 os.path 字符串操作，尽量少做文件系统 stat
+        filepath = os.fspath(filepath)
+        if not os.path.isfile(filepath):
             return f"[错误] 输入文件不存在：{filepath}"
 
         if output_csv is None:
-            output_csv = filepath.with_suffix(".csv")
+            output_csv = os.path.splitext(filepath)[0] + ".csv"
         else:
-            output_csv = Path(output_csv)
+            output_csv = os.fspath(output_csv)
 
         # 读取 DXF
-        doc = ezdxf.readfile(str(filepath))
+        doc = _readfile(filepath)
         msp = doc.modelspace()
 
-        rows: list[dict] = []
-        for ent in tqdm(msp, desc="解析实体"):
-            row = {
-                "Handle": ent.dxf.handle,
-                "EntityType": ent.dxftype(),
-                "Layer": ent.dxf.layer,
-                "Position": "N/A",
-            }
-
-            etype = ent.dxftype()
-            if etype in ("POLYLINE", "LWPOLYLINE"):
-                pts = [f"({p.x:.3f},{p.y:.3f},{p.z:.3f})" for p in ent.points()]
-                row["Position"] = "; ".join(pts)
-            elif etype == "LINE":
-                s, e = ent.dxf.start, ent.dxf.end
-                row["Position"] = (
-                    f"Start({s.x:.3f},{s.y:.3f},{s.z:.3f});"
-                    f"End({e.x:.3f},{e.y:.3f},{e.z:.3f})"
-                )
-            elif etype == "INSERT":
-                p = ent.dxf.insert
-                row["Position"] = f"({p.x:.3f},{p.y:.3f},{p.z:.3f})"
-                row["BlockName"] = ent.dxf.name
-            elif etype in ("TEXT", "MTEXT"):
-                p = ent.dxf.insert
-                row["Position"] = f"({p.x:.3f},{p.y:.3f},{p.z:.3f})"
-                row["TextValue"] = ent.dxf.text if etype == "TEXT" else ent.plain_text()
-            elif etype in ("CIRCLE", "ARC"):
-                c = ent.dxf.center
-                row["Position"] = f"Center({c.x:.3f},{c.y:.3f},{c.z:.3f})"
-                row["Radius"] = ent.dxf.radius
-            elif etype == "SPLINE":
-                pts = [f"({p.x:.3f},{p.y:.3f},{p.z:.3f})" for p in ent.control_points]
-                row["Position"] = "; ".join(pts)
-
-            if ent.has_xdata and ent.xdata is not None:
-                for app in ent.xdata.data:
-                    for code, value in ent.xdata.get(app):
-                        if code == 1000:
-                            row[app] = value
-                            break
-
-            rows.append(row)
-
-        if not rows:
+        if not len(msp):
             return f"[警告] DXF 中未发现任何实体：{filepath}"
 
-        # 写 CSV
-        fieldnames = set().union(*(r.keys() for r in rows))
-        preferred = [
-            "Handle",
-            "EntityType",
-            "Layer",
-            "BlockName",
-            "TextValue",
-            "Radius",
-            "Position",
+        # 第一遍：只收集 XDATA 应用名（动态列），不构建行
+        apps: set[str] = set()
+        for ent in msp:
+            apps.update(_xdata_values(ent))
+
+        # 与固定列同名的 XDATA 应用写入 "XDATA:<应用名>" 列，避免覆盖固定列
+        xdata_apps = sorted(apps)
+        final_fields = PREFERRED_FIELDS + [
+            f"XDATA:{app}" if app in _PREFERRED_SET else app for app in xdata_apps
         ]
-        final_fields = preferred + sorted(f for f in fieldnames if f not in preferred)
 
-        output_csv.parent.mkdir(parents=True, exist_ok=True)  # 确保目录存在
-        with open(output_csv, "w", newline="", encoding="utf-8-sig") as f:
-            writer = csv.DictWriter(f, final_fields, extrasaction="ignore")
-            writer.writeheader()
-            writer.writerows(rows)
+        # 第二遍：逐实体构建行并直接写出，不在内存中累积行
+        os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)  # 确保目录存在
+        with _open_csv(output_csv) as f:
+            writer = csv.writer(f)
+            writer.writerow(final_fields)
+            # 降低进度条刷新频率；disable=None 时 stderr 非终端（如 MCP stdio）自动关闭，
+            # 没有 stderr（如 pythonw）时 tqdm 无法自行判断，直接关闭
+            progress = tqdm(
+                msp,
+                desc="解析实体",
+                mininterval=2.0,
+                miniters=50_000,
+                disable=None if sys.stderr is not None else True,
+            )
+            for ent in progress:
+                row = _entity_row(ent)
+                if xdata_apps:
+                    x_values = _xdata_values(ent)
+                    row.extend(x_values.get(app, "") for app in xdata_apps)
+                writer.writerow(row)
 
-        return f"[成功] CSV 文件已生成：{output_csv.resolve()}"
+        return f"[成功] CSV 文件已生成：{os.path.abspath(output_csv)}"
 
     except Exception as e:
         return f"[错误] DXF 解析或导出失败：{e}"
 
 
+@mcp.tool(title="提取 DXF 实体并导出 CSV")
+async def dxf_entities_to_csv(
+    filepath: str,
+    output_csv: str | None = None,
+) -> str:
+    """
+    将 DXF 文件中的所有实体及其属性（位置、图层、文本、XDATA 等）提取并保存为 CSV 表格。
+
+    参数：
+    - filepath (str): 输入的 DXF 文件路径。
+    - output_csv (str | None): 可选，输出 CSV 文件路径。若未指定，将默认保存为与 DXF 同名的 CSV 文件；以 .gz 结尾时输出 gzip 压缩的 CSV。
+
+    返回：
+    - str: 实际生成的 CSV 文件路径。
+    """
+    return await asyncio.to_thread(_export_csv, filepath, output_csv)
+
+
 if __name__ == "__main__":
     mcp.run(transport="stdio")
\ No newline at end of file